@@ -63,3 +63,20 @@ class ExcelColumnDataType(enum.IntEnum):
     PackedBool5 = 0x1E
     PackedBool6 = 0x1F
     PackedBool7 = 0x20
+
+
+class ExcelVariant(enum.IntEnum):
+    Unknown = 0
+    Default = 1
+    Subrows = 2
+
+
+class Language(enum.IntEnum):
+    NONE = 0
+    Japanese = 1
+    English = 2
+    German = 3
+    French = 4
+    ChineseSimplified = 5
+    ChineseTraditional = 6
+    Korean = 7
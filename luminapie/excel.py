@@ -1,4 +1,4 @@
-from luminapie.enums import ExcelColumnDataType
+from luminapie.enums import ExcelColumnDataType, ExcelVariant, Language
 from luminapie.definitions import Definition
 
 
@@ -37,9 +37,9 @@ class ExcelHeader:
         self.page_count = int.from_bytes(self.data[10:12], 'big')
         self.language_count = int.from_bytes(self.data[12:14], 'big')
         self.unknown1 = int.from_bytes(self.data[14:16], 'big')
-        self.unknown2 = self.data[17]
-        self.variant = self.data[18]
-        self.unknown3 = int.from_bytes(self.data[19:20], 'big')
+        self.unknown2 = self.data[16]
+        self.variant = self.data[17]
+        self.unknown3 = int.from_bytes(self.data[18:20], 'big')
         self.row_count = int.from_bytes(self.data[20:24], 'big')
         self.unknown4 = [int.from_bytes(self.data[24:28], 'big'), int.from_bytes(self.data[28:32], 'big')]
 
@@ -69,8 +69,8 @@ class ExcelDataPagination:
         self.parse()
 
     def parse(self):
-        self.start_id = int.from_bytes(self.data[0:2], 'big')
-        self.row_count = int.from_bytes(self.data[2:4], 'big')
+        self.start_id = int.from_bytes(self.data[0:4], 'big')
+        self.row_count = int.from_bytes(self.data[4:8], 'big')
 
     def __repr__(self):
         return f'''Pagination: {self.start_id:x}, count: {self.row_count}'''
@@ -100,15 +100,17 @@ class ExcelHeaderFile:
                     self.data[
                         32
                         + (self.header.column_count * 4)
-                        + (i * 4) : 32
+                        + (i * 8) : 32
                         + (self.header.column_count * 4)
-                        + ((i + 1) * 4)
+                        + ((i + 1) * 8)
                     ]
                 )
             )
         self.languages: list[int] = []
         for i in range(self.header.language_count):
-            self.languages.append(self.data[32 + (self.header.column_count * 4) + (self.header.page_count * 4) + i])
+            self.languages.append(
+                self.data[32 + (self.header.column_count * 4) + (self.header.page_count * 8) + (i * 2)]
+            )
 
     def map_names(self, names: list[Definition]) -> tuple[dict[int, tuple[str, str]], int]:
         mapped: dict[int, tuple[str, str]] = {}
@@ -142,6 +144,93 @@ class ExcelHeaderFile:
         return [mapped, size]
 
 
+class ExcelDataHeader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.parse()
+
+    def parse(self):
+        self.magic = self.data[0:4]
+        self.version = int.from_bytes(self.data[4:6], 'big')
+        self.unknown1 = int.from_bytes(self.data[6:8], 'big')
+        self.index_size = int.from_bytes(self.data[8:12], 'big')
+        self.unknown2 = self.data[12:32]
+
+    def __repr__(self):
+        return f'''DataHeader: {self.magic}, version: {self.version}, index_size: {self.index_size}'''
+
+
+class ExcelDataOffset:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.parse()
+
+    def parse(self):
+        self.row_id = int.from_bytes(self.data[0:4], 'big')
+        self.offset = int.from_bytes(self.data[4:8], 'big')
+
+    def __repr__(self):
+        return f'''Row: {self.row_id}, offset: {self.offset:x}'''
+
+
+class ExcelDataFile:
+    def __init__(self, data: list[bytes]):
+        self.data = b''.join(data)
+        self.header: ExcelDataHeader = None
+        self.row_offsets: list[ExcelDataOffset] = []
+        self.parse()
+
+    def parse(self):
+        self.header = ExcelDataHeader(self.data[0:32])
+        if self.header.magic != b'EXDF':
+            raise Exception('Invalid EXDF header')
+        self.row_offsets: list[ExcelDataOffset] = []
+        for i in range(self.header.index_size // 8):
+            self.row_offsets.append(ExcelDataOffset(self.data[32 + (i * 8) : 32 + ((i + 1) * 8)]))
+
+    def get_row(self, row_offset: ExcelDataOffset, data_offset: int, variant: ExcelVariant):
+        """Returns the (subrow id, fixed size column data) of a row and where its strings start"""
+        row_count = int.from_bytes(self.data[row_offset.offset + 4 : row_offset.offset + 6], 'big')
+        row_start = row_offset.offset + 6
+        if variant == ExcelVariant.Subrows:
+            subrows: list[tuple[int, bytes]] = []
+            for i in range(row_count):
+                start = row_start + i * (data_offset + 2)
+                subrows.append(
+                    (
+                        int.from_bytes(self.data[start : start + 2], 'big'),
+                        self.data[start + 2 : start + 2 + data_offset],
+                    )
+                )
+            return subrows, row_start + row_count * (data_offset + 2)
+        return [(0, self.data[row_start : row_start + data_offset])], row_start + data_offset
+
+    def get_string(self, string_start: int, offset: int) -> bytes:
+        start = string_start + offset
+        return self.data[start : self.data.index(b'\0', start)]
+
+    def __repr__(self):
+        return f'''ExcelDataFile: {self.header}, rows: {len(self.row_offsets)}'''
+
+
+def get_language_suffix(language: Language) -> str:
+    if language == Language.Japanese:
+        return '_ja'
+    elif language == Language.English:
+        return '_en'
+    elif language == Language.German:
+        return '_de'
+    elif language == Language.French:
+        return '_fr'
+    elif language == Language.ChineseSimplified:
+        return '_chs'
+    elif language == Language.ChineseTraditional:
+        return '_cht'
+    elif language == Language.Korean:
+        return '_ko'
+    return ''
+
+
 def column_data_type_to_c_type(column_data_type: ExcelColumnDataType) -> str:
     if column_data_type == ExcelColumnDataType.Bool:
         return 'bool'
@@ -0,0 +1,234 @@
+from luminapie.game_data import GameData, ParsedFileName
+from luminapie.excel import ExcelHeaderFile, ExcelDataFile, ExcelColumnDefinition, get_language_suffix
+from luminapie.enums import ExcelColumnDataType, ExcelVariant, Language
+from typing import Union
+import numpy as np
+import shutil
+import json
+import os
+
+CACHE_FORMAT = 2
+
+
+def column_data_type_to_dtype(column_data_type: ExcelColumnDataType) -> str:
+    if column_data_type == ExcelColumnDataType.Int8:
+        return 'i1'
+    elif column_data_type == ExcelColumnDataType.Int16:
+        return '>i2'
+    elif column_data_type == ExcelColumnDataType.UInt16:
+        return '>u2'
+    elif column_data_type == ExcelColumnDataType.Int32:
+        return '>i4'
+    elif column_data_type == ExcelColumnDataType.UInt32 or column_data_type == ExcelColumnDataType.String:
+        return '>u4'
+    elif column_data_type == ExcelColumnDataType.Float32:
+        return '>f4'
+    elif column_data_type == ExcelColumnDataType.Int64:
+        return '>i8'
+    elif column_data_type == ExcelColumnDataType.UInt64:
+        return '>u8'
+    return 'u1'
+
+
+def get_column_names(game_data: GameData, name: str, column_count: int) -> list[str]:
+    names: list[str] = []
+    schema = game_data.schema.get(name, []) if game_data.load_schema else []
+    for i in range(column_count):
+        column_name = schema[i].name if i < len(schema) and schema[i].name != '' else f'Unknown{i}'
+        if column_name in names:
+            column_name = f'{column_name}_{i}'
+        names.append(column_name)
+    return names
+
+
+def resolve_language(header: ExcelHeaderFile, language: Language) -> Language:
+    if Language.NONE in header.languages or len(header.languages) == 0:
+        return Language.NONE
+    if language not in header.languages:
+        raise Exception(f'Language {language.name} is not available, sheet has {header.languages}')
+    return language
+
+
+class ExcelSheetColumns:
+    """A decoded sheet in the cache, columns are memory mapped from their .npy file when first used
+
+    Columns are stored by index, names come from the schema of the process loading the sheet and default to UnknownN
+    """
+
+    def __init__(self, path: str, names: list[str] = None):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.name: str = self.meta['sheet']
+        self.language = Language(self.meta['language'])
+        self.version: str = self.meta['version']
+        self.variant = ExcelVariant(self.meta['variant'])
+        if names is None:
+            names = [f'Unknown{i}' for i in range(len(self.meta['columns']))]
+        self.names = names
+        self.types = {names[i]: ExcelColumnDataType(column['type']) for i, column in enumerate(self.meta['columns'])}
+        self.arrays: dict[str, np.ndarray] = {}
+        self.string_data: dict[str, np.ndarray] = {}
+
+    def load(self, file: str) -> np.ndarray:
+        if file not in self.arrays:
+            self.arrays[file] = np.load(os.path.join(self.path, file), mmap_mode='r')
+        return self.arrays[file]
+
+    @property
+    def rows(self) -> np.ndarray:
+        return self.load('rows.npy')
+
+    @property
+    def subrows(self) -> np.ndarray:
+        return self.load('subrows.npy')
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def get_index(self, name: Union[str, int]) -> int:
+        return name if isinstance(name, int) else self.names.index(name)
+
+    def column(self, name: Union[str, int]) -> np.ndarray:
+        """Values of a column, string columns give the offsets of each value in the string data"""
+        return self.load(f'c{self.get_index(name)}.npy')
+
+    def get_string_data(self, index: int) -> np.ndarray:
+        file = f'c{index}.str'
+        if file not in self.string_data:
+            path = os.path.join(self.path, file)
+            if os.path.getsize(path) == 0:
+                self.string_data[file] = np.zeros(0, dtype='u1')
+            else:
+                self.string_data[file] = np.memmap(path, dtype='u1', mode='r')
+        return self.string_data[file]
+
+    def get_string(self, name: Union[str, int], i: int) -> bytes:
+        index = self.get_index(name)
+        offsets = self.column(index)
+        return self.get_string_data(index)[offsets[i] : offsets[i + 1]].tobytes()
+
+    def strings(self, name: Union[str, int]) -> list[bytes]:
+        index = self.get_index(name)
+        offsets = self.column(index)
+        data = self.get_string_data(index).tobytes()
+        return [data[offsets[i] : offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+    def __repr__(self):
+        return f'''ExcelSheetColumns: {self.name} ({self.language.name}, {self.version}), rows: {len(self)}, columns: {len(self.names)}'''
+
+
+class ExcelSheetCache:
+    """Columnar on-disk cache of decoded sheets keyed by game version, language and sheet name"""
+
+    def __init__(self, game_data: GameData, path: str):
+        self.game_data = game_data
+        self.path = path
+        self.version = repr(game_data.repositories[0].version)
+        self.headers: dict[str, ExcelHeaderFile] = {}
+
+    def get_header(self, name: str) -> ExcelHeaderFile:
+        if name not in self.headers:
+            self.headers[name] = ExcelHeaderFile(self.game_data.get_file(ParsedFileName(f'exd/{name}.exh')))
+        return self.headers[name]
+
+    def get_sheet_path(self, name: str, language: Language) -> str:
+        return os.path.join(self.path, self.version, language.name.lower(), *name.split('/'))
+
+    def get_sheet(self, name: str, language: Language = Language.English) -> ExcelSheetColumns:
+        header = self.get_header(name)
+        language = resolve_language(header, language)
+        path = self.get_sheet_path(name, language)
+        meta = os.path.join(path, 'meta.json')
+        if os.path.exists(meta):
+            with open(meta, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached['version'] == self.version and cached['format'] == CACHE_FORMAT:
+                return ExcelSheetColumns(path, self.get_column_names(name))
+        self.build_sheet(name, language, path)
+        return ExcelSheetColumns(path, self.get_column_names(name))
+
+    def get_column_names(self, name: str) -> list[str]:
+        return get_column_names(self.game_data, name, len(self.get_header(name).column_definitions))
+
+    def build_sheet(self, name: str, language: Language, path: str):
+        header = self.get_header(name)
+        data_offset = header.header.data_offset
+        rows: list[int] = []
+        subrows: list[int] = []
+        fixed: list[bytes] = []
+        string_columns = [
+            (i, column)
+            for i, column in enumerate(header.column_definitions)
+            if column.type == ExcelColumnDataType.String
+        ]
+        strings: dict[int, list[bytes]] = {i: [] for i, _ in string_columns}
+        suffix = get_language_suffix(language)
+        for page in header.pagination:
+            exd = ExcelDataFile(self.game_data.get_file(ParsedFileName(f'exd/{name}_{page.start_id}{suffix}.exd')))
+            for row_offset in exd.row_offsets:
+                row_subrows, string_start = exd.get_row(row_offset, data_offset, header.header.variant)
+                for subrow_id, data in row_subrows:
+                    rows.append(row_offset.row_id)
+                    subrows.append(subrow_id)
+                    fixed.append(data)
+                    for i, column in string_columns:
+                        offset = int.from_bytes(data[column.offset : column.offset + 4], 'big')
+                        strings[i].append(exd.get_string(string_start, offset))
+
+        temp = path + '.tmp'
+        if os.path.exists(temp):
+            shutil.rmtree(temp)
+        os.makedirs(temp)
+        np.save(os.path.join(temp, 'rows.npy'), np.array(rows, dtype='<u4'))
+        np.save(os.path.join(temp, 'subrows.npy'), np.array(subrows, dtype='<u2'))
+        buffer = b''.join(fixed)
+        for i, column in enumerate(header.column_definitions):
+            if column.type == ExcelColumnDataType.String:
+                self.write_strings(temp, i, strings[i])
+            else:
+                np.save(os.path.join(temp, f'c{i}.npy'), self.read_column(buffer, len(rows), data_offset, column))
+        meta = {
+            'format': CACHE_FORMAT,
+            'version': self.version,
+            'sheet': name,
+            'language': int(language),
+            'variant': header.header.variant,
+            'columns': [{'type': int(column.type), 'offset': column.offset} for column in header.column_definitions],
+        }
+        with open(os.path.join(temp, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(temp, path)
+
+    def read_column(self, buffer: bytes, count: int, data_offset: int, column: ExcelColumnDefinition) -> np.ndarray:
+        dtype = np.dtype(column_data_type_to_dtype(column.type))
+        if count == 0:
+            values = np.zeros(0, dtype=dtype)
+        else:
+            # every row is data_offset bytes, so a column is a strided view over the joined rows
+            values = np.ndarray((count,), dtype=dtype, buffer=buffer, offset=column.offset, strides=(data_offset,))
+        if column.type >= ExcelColumnDataType.PackedBool0:
+            return ((values >> (column.type - ExcelColumnDataType.PackedBool0)) & 1).astype('?')
+        elif column.type == ExcelColumnDataType.Bool:
+            return values != 0
+        return values.astype(dtype.newbyteorder('<'))
+
+    def write_strings(self, path: str, index: int, values: list[bytes]):
+        offsets = np.zeros(len(values) + 1, dtype='<u8')
+        np.cumsum([len(value) for value in values], out=offsets[1:])
+        np.save(os.path.join(path, f'c{index}.npy'), offsets)
+        with open(os.path.join(path, f'c{index}.str'), 'wb') as f:
+            f.write(b''.join(values))
+
+    def prune(self):
+        """Removes cached sheets of other game versions"""
+        if not os.path.exists(self.path):
+            return
+        for version in os.listdir(self.path):
+            if version != self.version:
+                shutil.rmtree(os.path.join(self.path, version))
+
+    def __repr__(self):
+        return f'''ExcelSheetCache: {self.path} ({self.version})'''
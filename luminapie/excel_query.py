@@ -0,0 +1,335 @@
+from luminapie.excel_cache import ExcelSheetCache, ExcelSheetColumns
+from luminapie.enums import ExcelColumnDataType, Language
+from typing import Any, Callable, Iterator, Union
+from abc import ABC, abstractmethod
+import numpy as np
+import operator
+
+
+ID_TYPES = {
+    ExcelColumnDataType.Int8,
+    ExcelColumnDataType.UInt8,
+    ExcelColumnDataType.Int16,
+    ExcelColumnDataType.UInt16,
+    ExcelColumnDataType.Int32,
+    ExcelColumnDataType.UInt32,
+    ExcelColumnDataType.Int64,
+    ExcelColumnDataType.UInt64,
+}
+
+
+def get_ids(sheet: ExcelSheetColumns, name: str) -> np.ndarray:
+    """Values of a column holding row ids of another sheet, only integer columns can"""
+    column_type = sheet.types[name]
+    if column_type not in ID_TYPES:
+        raise Exception(f'Column {name} of {sheet.name} is {column_type.name}, links and joins need an integer column')
+    return sheet.column(name)
+
+
+def get_values(sheet: ExcelSheetColumns, name: str) -> np.ndarray:
+    """Column values, string columns as a bytes array so they compare vectorized too
+
+    That copies the whole string data of the column, equality and isin use string_equals, which doesn't
+    """
+    if sheet.types[name] == ExcelColumnDataType.String:
+        return np.array(sheet.strings(name), dtype=bytes)
+    return sheet.column(name)
+
+
+def string_equals(sheet: ExcelSheetColumns, name: str, value: bytes) -> np.ndarray:
+    """Rows whose string equals value, only strings of the same length are read from the mapped string data"""
+    index = sheet.get_index(name)
+    offsets = sheet.column(index)
+    candidates = np.flatnonzero(np.diff(offsets) == len(value))
+    mask = np.zeros(len(offsets) - 1, dtype=bool)
+    if len(value) == 0 or len(candidates) == 0:
+        mask[candidates] = True
+        return mask
+    data = sheet.get_string_data(index)
+    strings = data[offsets[candidates].astype(np.int64)[:, None] + np.arange(len(value))]
+    mask[candidates] = (strings == np.frombuffer(value, dtype='u1')).all(axis=1)
+    return mask
+
+
+def is_string_column(sheet: ExcelSheetColumns, name: str, values: list) -> bool:
+    return sheet.types[name] == ExcelColumnDataType.String and all(isinstance(value, bytes) for value in values)
+
+
+def encode_value(value: Any) -> Any:
+    if isinstance(value, str):
+        return value.encode('utf-8')
+    if isinstance(value, (list, tuple, set)):
+        return [encode_value(x) for x in value]
+    return value
+
+
+class Predicate(ABC):
+    @abstractmethod
+    def evaluate(self, engine: 'ExcelQueryEngine', sheet: ExcelSheetColumns) -> np.ndarray:
+        pass
+
+    def __and__(self, other: 'Predicate') -> 'Predicate':
+        return Combined(operator.and_, self, other)
+
+    def __or__(self, other: 'Predicate') -> 'Predicate':
+        return Combined(operator.or_, self, other)
+
+    def __invert__(self) -> 'Predicate':
+        return Not(self)
+
+
+class Comparison(Predicate):
+    def __init__(self, name: str, op: Callable, value: Any):
+        self.name = name
+        self.op = op
+        self.value = encode_value(value)
+
+    def evaluate(self, engine: 'ExcelQueryEngine', sheet: ExcelSheetColumns) -> np.ndarray:
+        if self.op in (operator.eq, operator.ne) and is_string_column(sheet, self.name, [self.value]):
+            mask = string_equals(sheet, self.name, self.value)
+            return mask if self.op == operator.eq else ~mask
+        return np.asarray(self.op(get_values(sheet, self.name), self.value), dtype=bool)
+
+    def __repr__(self):
+        return f'''{self.name} {self.op.__name__} {self.value!r}'''
+
+
+class IsIn(Predicate):
+    def __init__(self, name: str, values: list):
+        self.name = name
+        self.values = encode_value(list(values))
+
+    def evaluate(self, engine: 'ExcelQueryEngine', sheet: ExcelSheetColumns) -> np.ndarray:
+        if is_string_column(sheet, self.name, self.values):
+            mask = np.zeros(len(sheet), dtype=bool)
+            for value in set(self.values):
+                mask |= string_equals(sheet, self.name, value)
+            return mask
+        return np.isin(get_values(sheet, self.name), self.values)
+
+    def __repr__(self):
+        return f'''{self.name} in {self.values!r}'''
+
+
+class Contains(Predicate):
+    def __init__(self, name: str, text: Union[str, bytes], ignore_case: bool = True):
+        self.name = name
+        self.text = encode_value(text)
+        self.ignore_case = ignore_case
+
+    def evaluate(self, engine: 'ExcelQueryEngine', sheet: ExcelSheetColumns) -> np.ndarray:
+        values = get_values(sheet, self.name)
+        text = self.text
+        if self.ignore_case:
+            values = np.char.lower(values)
+            text = text.lower()
+        return np.char.find(values, text) >= 0
+
+    def __repr__(self):
+        return f'''{self.name} contains {self.text!r}'''
+
+
+class Link(Predicate):
+    """Matches rows whose column holds the row id of a row in another sheet matching the predicate"""
+
+    def __init__(self, name: str, sheet: str, predicate: Predicate):
+        self.name = name
+        self.sheet = sheet
+        self.predicate = predicate
+
+    def evaluate(self, engine: 'ExcelQueryEngine', sheet: ExcelSheetColumns) -> np.ndarray:
+        target = engine.get_sheet(self.sheet)
+        ids = np.asarray(target.rows)[self.predicate.evaluate(engine, target)]
+        return np.isin(get_ids(sheet, self.name), ids)
+
+    def __repr__(self):
+        return f'''{self.name} -> {self.sheet}({self.predicate})'''
+
+
+class Combined(Predicate):
+    def __init__(self, op: Callable, left: Predicate, right: Predicate):
+        self.op = op
+        self.left = left
+        self.right = right
+
+    def evaluate(self, engine: 'ExcelQueryEngine', sheet: ExcelSheetColumns) -> np.ndarray:
+        return self.op(self.left.evaluate(engine, sheet), self.right.evaluate(engine, sheet))
+
+    def __repr__(self):
+        return f'''({self.left} {self.op.__name__.strip('_')} {self.right})'''
+
+
+class Not(Predicate):
+    def __init__(self, predicate: Predicate):
+        self.predicate = predicate
+
+    def evaluate(self, engine: 'ExcelQueryEngine', sheet: ExcelSheetColumns) -> np.ndarray:
+        return ~self.predicate.evaluate(engine, sheet)
+
+    def __repr__(self):
+        return f'''not {self.predicate}'''
+
+
+class Column:
+    """Builds predicates on a named column, e.g. col('LevelItem') > 600"""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __eq__(self, value: Any) -> Predicate:
+        return Comparison(self.name, operator.eq, value)
+
+    def __ne__(self, value: Any) -> Predicate:
+        return Comparison(self.name, operator.ne, value)
+
+    def __lt__(self, value: Any) -> Predicate:
+        return Comparison(self.name, operator.lt, value)
+
+    def __le__(self, value: Any) -> Predicate:
+        return Comparison(self.name, operator.le, value)
+
+    def __gt__(self, value: Any) -> Predicate:
+        return Comparison(self.name, operator.gt, value)
+
+    def __ge__(self, value: Any) -> Predicate:
+        return Comparison(self.name, operator.ge, value)
+
+    def isin(self, values: list) -> Predicate:
+        return IsIn(self.name, values)
+
+    def contains(self, text: Union[str, bytes], ignore_case: bool = True) -> Predicate:
+        return Contains(self.name, text, ignore_case)
+
+    def link(self, sheet: str, predicate: Predicate) -> Predicate:
+        return Link(self.name, sheet, predicate)
+
+    def __repr__(self):
+        return f'''Column: {self.name}'''
+
+
+def col(name: str) -> Column:
+    return Column(name)
+
+
+class RowIndex:
+    """Maps row ids to positions in a sheet, subrow sheets resolve to the first subrow"""
+
+    def __init__(self, rows: np.ndarray):
+        self.order = np.argsort(rows, kind='stable')
+        self.sorted = np.asarray(rows)[self.order]
+
+    def lookup(self, ids: np.ndarray) -> np.ndarray:
+        """Positions of the ids, -1 where the sheet has no such row"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(self.sorted) == 0:
+            return np.full(len(ids), -1, dtype=np.int64)
+        positions = np.searchsorted(self.sorted, ids).clip(0, len(self.sorted) - 1)
+        found = self.sorted[positions] == ids
+        return np.where(found, self.order[positions], -1)
+
+
+class QueryResult:
+    def __init__(self, rows: np.ndarray, subrows: np.ndarray, columns: dict[str, Union[np.ndarray, list]]):
+        self.rows = rows
+        self.subrows = subrows
+        self.columns = columns
+
+    def __getitem__(self, name: str) -> Union[np.ndarray, list]:
+        return self.columns[name]
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        for i in range(len(self.rows)):
+            row = {'#': int(self.rows[i]), '#subrow': int(self.subrows[i])}
+            for name, values in self.columns.items():
+                value = values[i]
+                if value is np.ma.masked:
+                    value = None
+                row[name] = value.item() if isinstance(value, np.generic) else value
+            yield row
+
+    def __repr__(self):
+        return f'''QueryResult: {len(self)} rows, columns: {list(self.columns)}'''
+
+
+class Query:
+    def __init__(self, engine: 'ExcelQueryEngine', sheet: str):
+        self.engine = engine
+        self.sheet = sheet
+        self.predicate: Predicate = None
+        self.columns: list[str] = []
+        self.joins: list[tuple[str, str, list[str]]] = []
+
+    def where(self, predicate: Predicate) -> 'Query':
+        self.predicate = predicate if self.predicate is None else self.predicate & predicate
+        return self
+
+    def select(self, *columns: str) -> 'Query':
+        self.columns.extend(columns)
+        return self
+
+    def join(self, column: str, sheet: str, *columns: str) -> 'Query':
+        """Adds columns of the row in sheet whose id is held in column, named 'column.target'"""
+        self.joins.append((column, sheet, list(columns)))
+        return self
+
+    def gather(self, sheet: ExcelSheetColumns, name: str, positions: np.ndarray) -> Union[np.ndarray, list]:
+        # only the selected rows are read, which keeps untouched pages of the mapped files on disk
+        if sheet.types[name] == ExcelColumnDataType.String:
+            return [sheet.get_string(name, int(i)) if i >= 0 else None for i in positions]
+        values = sheet.column(name)
+        if len(values) == 0:
+            return np.ma.masked_all(len(positions), dtype=values.dtype)
+        return np.ma.masked_array(values[positions.clip(0)], mask=positions < 0)
+
+    def execute(self) -> QueryResult:
+        sheet = self.engine.get_sheet(self.sheet)
+        if self.predicate is None:
+            positions = np.arange(len(sheet))
+        else:
+            positions = np.flatnonzero(self.predicate.evaluate(self.engine, sheet))
+        columns: dict[str, Union[np.ndarray, list]] = {}
+        for name in self.columns:
+            columns[name] = self.gather(sheet, name, positions)
+            if isinstance(columns[name], np.ma.MaskedArray):
+                columns[name] = columns[name].data
+        for column, target_name, target_columns in self.joins:
+            target = self.engine.get_sheet(target_name)
+            target_positions = self.engine.get_row_index(target_name).lookup(get_ids(sheet, column)[positions])
+            for name in target_columns:
+                columns[f'{column}.{name}'] = self.gather(target, name, target_positions)
+        return QueryResult(np.asarray(sheet.rows)[positions], np.asarray(sheet.subrows)[positions], columns)
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        return iter(self.execute())
+
+    def __repr__(self):
+        return f'''Query: {self.sheet} where {self.predicate} select {self.columns} join {self.joins}'''
+
+
+class ExcelQueryEngine:
+    """Runs queries over sheets in an ExcelSheetCache, sheets and row indexes are loaded on first use"""
+
+    def __init__(self, cache: ExcelSheetCache, language: Language = Language.English):
+        self.cache = cache
+        self.language = language
+        self.sheets: dict[str, ExcelSheetColumns] = {}
+        self.row_indexes: dict[str, RowIndex] = {}
+
+    def get_sheet(self, name: str) -> ExcelSheetColumns:
+        if name not in self.sheets:
+            self.sheets[name] = self.cache.get_sheet(name, self.language)
+        return self.sheets[name]
+
+    def get_row_index(self, name: str) -> RowIndex:
+        if name not in self.row_indexes:
+            self.row_indexes[name] = RowIndex(self.get_sheet(name).rows)
+        return self.row_indexes[name]
+
+    def query(self, sheet: str) -> Query:
+        return Query(self, sheet)
+
+    def __repr__(self):
+        return f'''ExcelQueryEngine: {self.cache}, {self.language.name}, loaded: {list(self.sheets)}'''
@@ -0,0 +1,237 @@
+from luminapie.excel_cache import ExcelSheetCache, resolve_language
+from luminapie.excel import get_language_suffix
+from luminapie.enums import ExcelColumnDataType, Language
+from luminapie.game_data import ParsedFileName
+from luminapie.sqpack import SqPack
+from typing import Iterator
+import unicodedata
+import sqlite3
+import zlib
+import re
+
+INDEX_FORMAT = 1
+
+# CJK text has no spaces between words, so runs of ideographs, kana and hangul are split into character n-grams
+CJK = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af'
+TOKEN = re.compile(f'[^\\W{CJK}]+|[{CJK}]+')
+CJK_RUN = re.compile(f'[{CJK}]+')
+
+# (sheet, language, row, subrow, column)
+TextMatch = tuple[str, Language, int, int, str]
+
+
+def normalize(text: str) -> str:
+    return unicodedata.normalize('NFKC', text).casefold()
+
+
+def read_integer(value: bytes, offset: int) -> tuple[int, int]:
+    """SeString packed integer at offset, returns the value and the offset after it"""
+    marker = value[offset]
+    offset += 1
+    if marker < 0xF0:
+        return marker - 1, offset
+    # the low nibble of marker + 1 flags which bytes of a big endian uint32 follow
+    flags = (marker + 1) & 0xF
+    result = 0
+    for bit, shift in ((8, 24), (4, 16), (2, 8), (1, 0)):
+        if flags & bit:
+            result |= value[offset] << shift
+            offset += 1
+    return result, offset
+
+
+def strip_payloads(value: bytes) -> bytes:
+    """Text of a SeString, payloads (0x02, type, length, body, 0x03) hold formatting and are replaced by a space"""
+    parts: list[bytes] = []
+    start = 0
+    offset = value.find(2)
+    while offset >= 0:
+        parts.append(value[start:offset])
+        try:
+            length, body = read_integer(value, offset + 2)
+        except IndexError:
+            # truncated payload, nothing after it is text
+            return b' '.join(parts)
+        # the body can hold 0x03 itself, so the length decides where the payload ends
+        start = body + max(length, 0) + 1
+        offset = value.find(2, start)
+    parts.append(value[start:])
+    return b' '.join(parts)
+
+
+def get_tokens(text: str, query: bool = False) -> list[str]:
+    """Words of normalized text, CJK runs give their characters and character pairs
+
+    A query only needs the pairs of a run, every cell holding them holds the characters too
+    """
+    tokens: list[str] = []
+    for word in TOKEN.findall(text):
+        if not CJK_RUN.fullmatch(word):
+            tokens.append(word)
+            continue
+        if not query or len(word) == 1:
+            tokens.extend(word)
+        tokens.extend(word[i : i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+def tokenize(value: bytes) -> set[str]:
+    return set(get_tokens(normalize(strip_payloads(value).decode('utf-8', errors='ignore'))))
+
+
+class ExcelTextIndex:
+    """Inverted index of the string columns of sheets, persisted to SQLite with the game version
+
+    Prefixes are answered by range scans over the sorted token key, so only whole tokens are stored. CJK runs are
+    stored as characters and character pairs, which matches any part of a name and not only its start
+    """
+
+    def __init__(self, cache: ExcelSheetCache, path: str):
+        self.cache = cache
+        self.path = path
+        self.data_files: dict[str, SqPack] = {}
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS sheets ('
+            'sheet TEXT NOT NULL, language INTEGER NOT NULL, fingerprint INTEGER NOT NULL, '
+            'PRIMARY KEY (sheet, language)) WITHOUT ROWID'
+        )
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS postings ('
+            'token TEXT NOT NULL, sheet TEXT NOT NULL, language INTEGER NOT NULL, '
+            'row INTEGER NOT NULL, subrow INTEGER NOT NULL, col TEXT NOT NULL, '
+            'PRIMARY KEY (token, sheet, language, row, subrow, col)) WITHOUT ROWID'
+        )
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'format'").fetchone()
+        if row is None or row[0] != str(INDEX_FORMAT):
+            # postings of another tokenizer can't be matched against, every sheet is indexed again
+            self.connection.execute('DELETE FROM postings')
+            self.connection.execute('DELETE FROM sheets')
+            self.connection.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('format', str(INDEX_FORMAT)))
+        self.connection.commit()
+
+    @property
+    def version(self) -> str:
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return row[0] if row is not None else None
+
+    def get_fingerprint(self, name: str, language: Language) -> int:
+        """crc32 over the location and block table of the sheet's .exh and .exd pages"""
+        header = self.cache.get_header(name)
+        suffix = get_language_suffix(language)
+        paths = [f'exd/{name}.exh'] + [f'exd/{name}_{page.start_id}{suffix}.exd' for page in header.pagination]
+        locations: list[str] = []
+        for path in paths:
+            file = ParsedFileName(path)
+            index, sqpack = self.cache.game_data.repositories[0].get_index(file.index)
+            path = sqpack.data_files[index.data_file_id()]
+            if path not in self.data_files:
+                self.data_files[path] = SqPack(sqpack.root, path)
+            _, file_header = self.data_files[path].read_file_header(index.data_file_offset())
+            locations.append(f'{path}:{index.data_file_offset()}:{zlib.crc32(file_header)}')
+        return zlib.crc32('|'.join(locations).encode('utf-8'))
+
+    def update(self, sheets: list[str], languages: list[Language] = None) -> list[tuple[str, Language]]:
+        """Indexes the sheets, only those whose files changed since the last update are rebuilt"""
+        if languages is None:
+            languages = [Language.English]
+        rebuilt: list[tuple[str, Language]] = []
+        for name in sheets:
+            header = self.cache.get_header(name)
+            for language in {resolve_language(header, language) for language in languages}:
+                fingerprint = self.get_fingerprint(name, language)
+                row = self.connection.execute(
+                    'SELECT fingerprint FROM sheets WHERE sheet = ? AND language = ?', (name, int(language))
+                ).fetchone()
+                if row is not None and row[0] == fingerprint:
+                    continue
+                self.index_sheet(name, language, fingerprint)
+                rebuilt.append((name, language))
+        self.connection.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('version', self.cache.version))
+        self.connection.commit()
+        return rebuilt
+
+    def index_sheet(self, name: str, language: Language, fingerprint: int):
+        sheet = self.cache.get_sheet(name, language)
+        rows = sheet.rows
+        subrows = sheet.subrows
+        postings: list[tuple[str, str, int, int, int, str]] = []
+        for column in sheet.names:
+            if sheet.types[column] != ExcelColumnDataType.String:
+                continue
+            for i, value in enumerate(sheet.strings(column)):
+                for token in tokenize(value):
+                    postings.append((token, name, int(language), int(rows[i]), int(subrows[i]), column))
+        self.connection.execute('DELETE FROM postings WHERE sheet = ? AND language = ?', (name, int(language)))
+        self.connection.executemany('INSERT OR IGNORE INTO postings VALUES (?, ?, ?, ?, ?, ?)', postings)
+        self.connection.execute('INSERT OR REPLACE INTO sheets VALUES (?, ?, ?)', (name, int(language), fingerprint))
+
+    def remove(self, name: str, language: Language = None):
+        if language is None:
+            self.connection.execute('DELETE FROM postings WHERE sheet = ?', (name,))
+            self.connection.execute('DELETE FROM sheets WHERE sheet = ?', (name,))
+        else:
+            self.connection.execute('DELETE FROM postings WHERE sheet = ? AND language = ?', (name, int(language)))
+            self.connection.execute('DELETE FROM sheets WHERE sheet = ? AND language = ?', (name, int(language)))
+        self.connection.commit()
+
+    def find_token(self, token: str, prefix: bool, sheet: str = None, language: Language = None) -> set[TextMatch]:
+        if prefix:
+            query = 'SELECT sheet, language, row, subrow, col FROM postings WHERE token >= ? AND token < ?'
+            args = [token, token + '\U0010ffff']
+        else:
+            query = 'SELECT sheet, language, row, subrow, col FROM postings WHERE token = ?'
+            args = [token]
+        if sheet is not None:
+            query += ' AND sheet = ?'
+            args.append(sheet)
+        if language is not None:
+            query += ' AND language = ?'
+            args.append(int(language))
+        return {
+            (sheet, Language(language), row, subrow, column)
+            for sheet, language, row, subrow, column in self.connection.execute(query, args)
+        }
+
+    def search(self, text: str, sheet: str = None, language: Language = None, prefix: bool = True) -> list[TextMatch]:
+        """Cells containing every word of text, the last word also matches as a prefix for autocomplete"""
+        tokens = get_tokens(normalize(text), query=True)
+        if not tokens:
+            return []
+        matches: set[TextMatch] = None
+        for i, token in enumerate(tokens):
+            found = self.find_token(token, prefix and i == len(tokens) - 1, sheet, language)
+            matches = found if matches is None else matches & found
+            if not matches:
+                return []
+        return sorted(matches)
+
+    def complete(self, prefix: str, limit: int = 10) -> list[str]:
+        prefix = normalize(prefix)
+        return [
+            token
+            for (token,) in self.connection.execute(
+                'SELECT DISTINCT token FROM postings WHERE token >= ? AND token < ? ORDER BY token LIMIT ?',
+                (prefix, prefix + '\U0010ffff', limit),
+            )
+        ]
+
+    def tokens(self) -> Iterator[str]:
+        for (token,) in self.connection.execute('SELECT DISTINCT token FROM postings ORDER BY token'):
+            yield token
+
+    def close(self):
+        for data_file in self.data_files.values():
+            data_file.file.close()
+        self.data_files = {}
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return f'''ExcelTextIndex: {self.path} ({self.version}), sheets: {self.connection.execute('SELECT COUNT(*) FROM sheets').fetchone()[0]}'''
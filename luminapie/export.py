@@ -0,0 +1,202 @@
+from luminapie.game_data import GameData, ParsedFileName
+from luminapie.hash_list import HashDatabase
+from luminapie.enums import SqPackCatergories
+from luminapie.sqpack import SqPack
+from multiprocessing import Pool
+from typing import Union
+import hashlib
+import shutil
+import json
+import time
+import os
+
+MANIFEST_NAME = '.export_manifest.jsonl'
+OBJECTS_NAME = '.objects'
+TASK_ENTRIES = 64
+
+# (data file, [(offset, output paths sharing that offset)])
+ExportTask = tuple[str, list[tuple[int, list[str]]]]
+
+output_root: str = None
+sqpacks: dict[str, SqPack] = {}
+
+
+def init_worker(output: str):
+    global output_root
+    output_root = output
+
+
+def get_sqpack(path: str) -> SqPack:
+    if path not in sqpacks:
+        sqpacks[path] = SqPack(os.path.dirname(path), path)
+    return sqpacks[path]
+
+
+def place_file(source: str, path: str):
+    target = os.path.join(output_root, path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def export_entry(dat_path: str, offset: int, paths: list[str]) -> tuple[str, int]:
+    data = get_sqpack(dat_path).read_file(offset)
+    sha1 = hashlib.sha1()
+    objects = os.path.join(output_root, OBJECTS_NAME)
+    temp = os.path.join(objects, f'.tmp{os.getpid()}')
+    size = 0
+    with open(temp, 'wb') as f:
+        for block in data:
+            sha1.update(block)
+            f.write(block)
+            size += len(block)
+    digest = sha1.hexdigest()
+    stored = os.path.join(objects, digest[0:2], digest)
+    if os.path.exists(stored):
+        os.remove(temp)
+    else:
+        os.makedirs(os.path.dirname(stored), exist_ok=True)
+        # identical payloads written concurrently replace each other with the same bytes
+        os.replace(temp, stored)
+    for path in paths:
+        place_file(stored, path)
+    return digest, size
+
+
+def export_task(task: ExportTask) -> list[dict]:
+    dat_path, entries = task
+    results: list[dict] = []
+    for offset, paths in entries:
+        try:
+            digest, size = export_entry(dat_path, offset, paths)
+            results.extend({'path': path, 'sha1': digest, 'size': size} for path in paths)
+        except Exception as e:
+            results.extend({'path': path, 'error': str(e)} for path in paths)
+    return results
+
+
+class ExportReport:
+    def __init__(self):
+        self.exported = 0
+        self.resumed = 0
+        self.unique = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.errors: dict[str, str] = {}
+
+    def __repr__(self):
+        return f'''ExportReport: exported: {self.exported}, resumed: {self.resumed}, unique: {self.unique}, {self.bytes / (1 << 20):.1f} MiB in {self.seconds:.1f}s, errors: {len(self.errors)}'''
+
+
+class Exporter:
+    """Exports files to a directory tree in data file order, resuming from the manifest of a previous run"""
+
+    def __init__(self, game_data: GameData, output: str, hash_database: HashDatabase = None, processes: int = None):
+        self.game_data = game_data
+        self.output = output
+        self.hash_database = hash_database
+        self.processes = processes
+        # output path -> (data file, offset)
+        self.entries: dict[str, tuple[str, int]] = {}
+        self.errors: dict[str, str] = {}
+
+    def add_paths(self, paths: list[str]):
+        for path in paths:
+            file = ParsedFileName(path)
+            repo = self.game_data.repositories.get(self.game_data.get_repo_index(file.repo))
+            if repo is None or file.index not in repo.index:
+                self.errors[file.path] = 'File not found'
+                continue
+            index, sqpack = repo.get_index(file.index)
+            self.entries[file.path] = (sqpack.data_files[index.data_file_id()], index.data_file_offset())
+
+    def add_categories(self, categories: list[Union[str, SqPackCatergories]]):
+        """Adds every file of the categories, files missing from the hash database are named by their hash"""
+        prefixes: dict[str, str] = {}
+        for category in categories:
+            if not isinstance(category, SqPackCatergories):
+                category = SqPackCatergories[category.upper()]
+            prefixes[f'{category.value:02x}'] = category.name.lower()
+        for repo in self.game_data.repositories.values():
+            for hash, (index, sqpack) in repo.index.items():
+                prefix = os.path.basename(sqpack.path)[0:2]
+                if prefix not in prefixes or index.is_synonym():
+                    continue
+                path = self.hash_database.get(hash) if self.hash_database is not None else None
+                if path is None:
+                    path = f'{prefixes[prefix]}/~{repo.name}/{hash:016x}'
+                self.entries[path] = (sqpack.data_files[index.data_file_id()], index.data_file_offset())
+
+    def read_manifest(self) -> dict[str, dict]:
+        done: dict[str, dict] = {}
+        path = os.path.join(self.output, MANIFEST_NAME)
+        if not os.path.exists(path):
+            return done
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # the last line of an interrupted run may be cut off
+                    continue
+                if 'sha1' in record:
+                    done[record['path']] = record
+        return done
+
+    def get_tasks(self, done: dict[str, dict]) -> list[ExportTask]:
+        locations: dict[tuple[str, int], list[str]] = {}
+        for path, location in self.entries.items():
+            if path not in done:
+                locations.setdefault(location, []).append(path)
+        tasks: list[ExportTask] = []
+        entries: list[tuple[int, list[str]]] = []
+        current: str = None
+        for dat_path, offset in sorted(locations):
+            if dat_path != current or len(entries) >= TASK_ENTRIES:
+                if entries:
+                    tasks.append((current, entries))
+                current = dat_path
+                entries = []
+            entries.append((offset, locations[(dat_path, offset)]))
+        if entries:
+            tasks.append((current, entries))
+        return tasks
+
+    def run(self) -> ExportReport:
+        report = ExportReport()
+        report.errors.update(self.errors)
+        start = time.perf_counter()
+        os.makedirs(os.path.join(self.output, OBJECTS_NAME), exist_ok=True)
+        done = self.read_manifest()
+        report.resumed = sum(1 for path in self.entries if path in done)
+        digests = {record['sha1'] for record in done.values()}
+        tasks = self.get_tasks(done)
+        with open(os.path.join(self.output, MANIFEST_NAME), 'a', encoding='utf-8') as manifest:
+            # tasks only carry offsets, payload memory is bounded by one file per worker
+            with Pool(self.processes, initializer=init_worker, initargs=(self.output,)) as pool:
+                for results in pool.imap_unordered(export_task, tasks):
+                    for record in results:
+                        if 'error' in record:
+                            report.errors[record['path']] = record['error']
+                            continue
+                        manifest.write(json.dumps(record) + '\n')
+                        report.exported += 1
+                        if record['sha1'] not in digests:
+                            digests.add(record['sha1'])
+                            report.unique += 1
+                            report.bytes += record['size']
+                    manifest.flush()
+        report.seconds = time.perf_counter() - start
+        return report
+
+
+def export_categories(
+    game_data: GameData, output: str, categories: list[Union[str, SqPackCatergories]], **kwargs
+) -> ExportReport:
+    exporter = Exporter(game_data, output, **kwargs)
+    exporter.add_categories(categories)
+    return exporter.run()
@@ -3,6 +3,7 @@ from luminapie.file_handlers import get_game_data_folders, get_sqpack_index
 from luminapie.se_crc import Crc32
 from luminapie.exdschema import get_definitions
 from luminapie.definitions import SemanticVersion
+from typing import Union
 import os
 
 crc = Crc32()
@@ -14,6 +15,7 @@ class Repository:
         self.name = name
         self.sqpacks: list[SqPack] = []
         self.index: dict[int, tuple[SqPackIndexHashTable, SqPack]] = {}
+        self.preloaded: dict[int, Union[bytes, memoryview]] = {}
         self.expansion_id = 0
         self.get_expansion_id()
 
@@ -46,6 +48,9 @@ class Repository:
         return self.index[hash]
 
     def get_file(self, hash: int):
+        if hash in self.preloaded:
+            # a shared index preloads views into its segment, the file is only copied when it's read
+            return [bytes(self.preloaded[hash])]
         index, sqpack = self.get_index(hash)
         id = index.data_file_id()
         offset = index.data_file_offset()
@@ -56,10 +61,11 @@ class Repository:
 
 
 class GameData:
-    def __init__(self, root: str, load_schema: bool = True):
+    def __init__(self, root: str, load_schema: bool = True, shared_index: 'SharedIndex' = None):
         self.root = root
         self.repositories: dict[int, Repository] = {}
         self.load_schema = load_schema
+        self.shared_index = shared_index
         self.setup()
 
     def get_repo_index(self, folder: str):
@@ -69,13 +75,16 @@ class GameData:
             return int(folder.removeprefix('ex'))
 
     def setup(self):
-        for folder in get_game_data_folders(self.root):
-            self.repositories[self.get_repo_index(folder)] = Repository(folder, self.root)
+        if self.shared_index is not None:
+            self.repositories = self.shared_index.get_repositories()
+        else:
+            for folder in get_game_data_folders(self.root):
+                self.repositories[self.get_repo_index(folder)] = Repository(folder, self.root)
 
-        for folder in self.repositories:
-            repo = self.repositories[folder]
-            repo.parse_version()
-            repo.setup_indexes()
+            for folder in self.repositories:
+                repo = self.repositories[folder]
+                repo.parse_version()
+                repo.setup_indexes()
 
         if self.load_schema:
             self.schema = get_definitions(self.repositories[0].version)
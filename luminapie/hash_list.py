@@ -0,0 +1,137 @@
+from luminapie.game_data import GameData
+from multiprocessing import Pool
+from typing import Iterator, Union
+import sqlite3
+import zlib
+
+
+def calc_index(path: str) -> int:
+    # same result as Crc32.calc_index, the SE crc is the zlib crc without the final xor
+    folder, _, filename = path.rpartition('/')
+    foldercrc = zlib.crc32(folder.encode('utf-8')) ^ 0xFFFFFFFF
+    filecrc = zlib.crc32(filename.encode('utf-8')) ^ 0xFFFFFFFF
+    return foldercrc << 32 | filecrc
+
+
+# the hashes being resolved, set once per pool worker by init_worker so batches don't carry them
+worker_hashes: set[int] = set()
+
+
+def init_worker(hashes: set[int]):
+    global worker_hashes
+    worker_hashes = hashes
+
+
+def hash_batch(paths: list[str]) -> tuple[int, list[tuple[int, str]]]:
+    """Number of paths hashed and the (hash, path) pairs whose hash is being resolved"""
+    found: list[tuple[int, str]] = []
+    for path in paths:
+        hash = calc_index(path)
+        if hash in worker_hashes:
+            found.append((hash, path))
+    return len(paths), found
+
+
+def read_path_list(path: str, batch_size: int) -> Iterator[list[str]]:
+    batch: list[str] = []
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.lower().strip()
+            if line == '' or '/' not in line:
+                continue
+            batch.append(line)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+class HashDatabase:
+    """Persisted hash -> path lookup backed by SQLite, keyed by the 64 bit index hash"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS paths ('
+            'folder_hash INTEGER NOT NULL, file_hash INTEGER NOT NULL, path TEXT NOT NULL, '
+            'PRIMARY KEY (folder_hash, file_hash)) WITHOUT ROWID'
+        )
+
+    def add(self, entries: list[tuple[int, str]]):
+        self.connection.executemany(
+            'INSERT OR IGNORE INTO paths VALUES (?, ?, ?)',
+            ((hash >> 32, hash & 0xFFFFFFFF, path) for hash, path in entries),
+        )
+
+    def commit(self):
+        self.connection.commit()
+
+    def get(self, hash: int) -> Union[str, None]:
+        row = self.connection.execute(
+            'SELECT path FROM paths WHERE folder_hash = ? AND file_hash = ?', (hash >> 32, hash & 0xFFFFFFFF)
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def __getitem__(self, hash: int) -> str:
+        path = self.get(hash)
+        if path is None:
+            raise KeyError(hash)
+        return path
+
+    def __contains__(self, hash: int) -> bool:
+        return self.get(hash) is not None
+
+    def __len__(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM paths').fetchone()[0]
+
+    def items(self) -> Iterator[tuple[int, str]]:
+        for folder_hash, file_hash, path in self.connection.execute('SELECT folder_hash, file_hash, path FROM paths'):
+            yield folder_hash << 32 | file_hash, path
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return f'''HashDatabase: {self.path} ({len(self)} paths)'''
+
+
+class HashListResolver:
+    """Resolves index hashes back to paths by hashing a path list across a process pool"""
+
+    def __init__(self, hashes: set[int], processes: int = None, batch_size: int = 20000):
+        self.hashes = hashes
+        self.processes = processes
+        self.batch_size = batch_size
+        self.checked = 0
+        self.resolved = 0
+
+    @classmethod
+    def from_game_data(cls, game_data: GameData, **kwargs) -> 'HashListResolver':
+        hashes: set[int] = set()
+        for repo in game_data.repositories.values():
+            hashes.update(repo.index.keys())
+        return cls(hashes, **kwargs)
+
+    def resolve(self, path_list: str, database: HashDatabase) -> HashDatabase:
+        # workers filter against their own copy of the hashes and send back only the matches
+        with Pool(self.processes, initializer=init_worker, initargs=(self.hashes,)) as pool:
+            for checked, found in pool.imap(hash_batch, read_path_list(path_list, self.batch_size)):
+                self.checked += checked
+                self.resolved += len(found)
+                database.add(found)
+        database.commit()
+        return database
+
+    def resolve_to_file(self, path_list: str, output: str) -> HashDatabase:
+        return self.resolve(path_list, HashDatabase(output))
+
+    def __repr__(self):
+        return f'''HashListResolver: {len(self.hashes)} hashes, checked: {self.checked}, resolved: {self.resolved}'''
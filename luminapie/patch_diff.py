@@ -0,0 +1,185 @@
+from luminapie.game_data import GameData
+from luminapie.definitions import SemanticVersion
+from luminapie.sqpack import SqPack
+from luminapie.enums import SqPackFileType
+from typing import Iterator, Union
+import sqlite3
+import zlib
+import os
+
+# (sqpack name, data file id, data file offset)
+IndexLocation = tuple[str, int, int]
+
+
+class IndexSnapshot:
+    """Locations of every index entry of a game install, tagged with the game version"""
+
+    def __init__(
+        self,
+        version: SemanticVersion,
+        entries: dict[str, dict[int, IndexLocation]],
+        root: str = None,
+        fingerprints: dict[tuple[str, int], int] = None,
+    ):
+        self.version = version
+        self.entries = entries
+        self.root = root
+        self.fingerprints = fingerprints if fingerprints is not None else {}
+        self.sqpacks: dict[str, SqPack] = {}
+
+    @classmethod
+    def from_game_data(cls, game_data: GameData) -> 'IndexSnapshot':
+        entries: dict[str, dict[int, IndexLocation]] = {}
+        for repo in game_data.repositories.values():
+            locations: dict[int, IndexLocation] = {}
+            for hash, (index, sqpack) in repo.index.items():
+                name = os.path.basename(sqpack.path).rsplit('.', 1)[0]
+                locations[hash] = (name, index.data_file_id(), index.data_file_offset())
+            entries[repo.name] = locations
+        return cls(game_data.repositories[0].version, entries, game_data.root)
+
+    @classmethod
+    def from_game_dir(cls, root: str) -> 'IndexSnapshot':
+        return cls.from_game_data(GameData(root, load_schema=False))
+
+    def get_data_file(self, repo: str, location: IndexLocation) -> SqPack:
+        path = os.path.join(self.root, 'sqpack', repo, f'{location[0]}.dat{location[1]}')
+        if path not in self.sqpacks:
+            self.sqpacks[path] = SqPack(self.root, path)
+        return self.sqpacks[path]
+
+    def fingerprint(self, repo: str, hash: int) -> Union[int, None]:
+        """crc32 of the file header and every block as stored, None if it can't be read
+
+        The blocks are hashed without inflating them, so a rewrite that keeps every size still changes the fingerprint.
+        It reads the whole entry, which is why diffs only fingerprint entries whose location changed
+        """
+        key = (repo, hash)
+        if key not in self.fingerprints:
+            if self.root is None:
+                return None
+            location = self.entries[repo][hash]
+            try:
+                sqpack = self.get_data_file(repo, location)
+                file_info, header = sqpack.read_file_header(location[2])
+                crc = zlib.crc32(header)
+                if file_info.type == SqPackFileType.Texture:
+                    crc = zlib.crc32(sqpack.read_texture_prefix(file_info), crc)
+                for offset in sqpack.get_block_offsets(file_info):
+                    crc = zlib.crc32(sqpack.read_raw_block(offset), crc)
+            except (OSError, ValueError, zlib.error):
+                return None
+            self.fingerprints[key] = crc
+        return self.fingerprints[key]
+
+    def items(self) -> Iterator[tuple[str, int, IndexLocation]]:
+        for repo in self.entries:
+            for hash, location in self.entries[repo].items():
+                yield repo, hash, location
+
+    def save(self, path: str, fingerprints: bool = False):
+        """Writes the snapshot to a SQLite file
+
+        Fingerprints computed so far are always kept. fingerprints=True computes the rest so later diffs can tell
+        relocated from modified without this install, but that reads every entry of the install once
+        """
+        if os.path.exists(path):
+            os.remove(path)
+        items = sorted(self.items(), key=lambda item: (item[0], item[2]))
+        with sqlite3.connect(path) as connection:
+            connection.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+            connection.execute(
+                'CREATE TABLE entries ('
+                'repo TEXT NOT NULL, folder_hash INTEGER NOT NULL, file_hash INTEGER NOT NULL, '
+                'sqpack TEXT NOT NULL, data_file INTEGER NOT NULL, offset INTEGER NOT NULL, fingerprint INTEGER, '
+                'PRIMARY KEY (repo, folder_hash, file_hash)) WITHOUT ROWID'
+            )
+            connection.execute('INSERT INTO meta VALUES (?, ?)', ('version', repr(self.version)))
+            connection.executemany(
+                'INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (
+                    (
+                        repo,
+                        hash >> 32,
+                        hash & 0xFFFFFFFF,
+                        *location,
+                        self.fingerprint(repo, hash) if fingerprints else self.fingerprints.get((repo, hash)),
+                    )
+                    for repo, hash, location in items
+                ),
+            )
+        connection.close()
+
+    @classmethod
+    def load(cls, path: str, root: str = None) -> 'IndexSnapshot':
+        entries: dict[str, dict[int, IndexLocation]] = {}
+        fingerprints: dict[tuple[str, int], int] = {}
+        connection = sqlite3.connect(path)
+        version = connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+        for repo, folder_hash, file_hash, sqpack, data_file, offset, fingerprint in connection.execute(
+            'SELECT * FROM entries'
+        ):
+            hash = folder_hash << 32 | file_hash
+            entries.setdefault(repo, {})[hash] = (sqpack, data_file, offset)
+            if fingerprint is not None:
+                fingerprints[(repo, hash)] = fingerprint
+        connection.close()
+        return cls(SemanticVersion(*(int(v) for v in version.split('.'))), entries, root, fingerprints)
+
+    def diff(self, other: 'IndexSnapshot') -> 'IndexDiff':
+        return IndexDiff(self, other)
+
+    def close(self):
+        for sqpack in self.sqpacks.values():
+            sqpack.file.close()
+        self.sqpacks = {}
+
+    def __repr__(self):
+        return f'''IndexSnapshot: {self.version}, {sum(len(x) for x in self.entries.values())} entries'''
+
+
+class IndexDiff:
+    """Changes between two snapshots, modified means the location and the fingerprint changed
+
+    Only entries whose location changed are fingerprinted. One that can't be, e.g. because the old snapshot was
+    saved without fingerprints and its install is gone, counts as modified
+    """
+
+    def __init__(self, old: IndexSnapshot, new: IndexSnapshot):
+        self.old = old
+        self.new = new
+        self.added: list[tuple[str, int]] = []
+        self.removed: list[tuple[str, int]] = []
+        self.relocated: list[tuple[str, int]] = []
+        self.modified: list[tuple[str, int]] = []
+        self.compare()
+
+    def compare(self):
+        for repo in self.old.entries.keys() | self.new.entries.keys():
+            old_entries = self.old.entries.get(repo, {})
+            new_entries = self.new.entries.get(repo, {})
+            self.added.extend((repo, hash) for hash in new_entries.keys() - old_entries.keys())
+            self.removed.extend((repo, hash) for hash in old_entries.keys() - new_entries.keys())
+            # sorting by the new location keeps the fingerprint reads sequential
+            moved = sorted(
+                (hash for hash in old_entries.keys() & new_entries.keys() if old_entries[hash] != new_entries[hash]),
+                key=lambda hash: new_entries[hash],
+            )
+            for hash in moved:
+                old_fingerprint = self.old.fingerprint(repo, hash)
+                new_fingerprint = self.new.fingerprint(repo, hash)
+                if old_fingerprint is None or old_fingerprint != new_fingerprint:
+                    self.modified.append((repo, hash))
+                else:
+                    self.relocated.append((repo, hash))
+
+    def changed(self) -> set[tuple[str, int]]:
+        """Entries a cache built against the old snapshot has to rebuild or drop"""
+        return set(self.added) | set(self.removed) | set(self.modified)
+
+    def __repr__(self):
+        return f'''IndexDiff: {self.old.version} -> {self.new.version}, added: {len(self.added)}, removed: {len(self.removed)}, relocated: {len(self.relocated)}, modified: {len(self.modified)}'''
+
+
+def diff_game_dirs(old_root: str, new_root: str) -> IndexDiff:
+    return IndexSnapshot.from_game_dir(old_root).diff(IndexSnapshot.from_game_dir(new_root))
@@ -0,0 +1,226 @@
+from luminapie.game_data import GameData, Repository, ParsedFileName
+from luminapie.sqpack import SqPack, SqPackIndexHashTable
+from luminapie.excel import ExcelListFile
+from luminapie.definitions import SemanticVersion
+from multiprocessing import shared_memory, resource_tracker
+from collections.abc import Mapping
+from typing import Iterator
+import bisect
+import array
+import json
+import os
+
+MAGIC = b'LPIX'
+HEADER_SIZE = 16
+
+
+def align(offset: int, size: int = 8) -> int:
+    return offset + (-offset % size)
+
+
+class SharedRepositoryIndex(Mapping):
+    """Read-only view of a repository index stored as sorted flat arrays in shared memory"""
+
+    def __init__(self, hashes: memoryview, data: memoryview, sqpack_ids: memoryview, sqpacks: list[SqPack]):
+        self.hashes = hashes
+        self.data = data
+        self.sqpack_ids = sqpack_ids
+        self.sqpacks = sqpacks
+
+    def find(self, hash: int) -> int:
+        i = bisect.bisect_left(self.hashes, hash)
+        if i < len(self.hashes) and self.hashes[i] == hash:
+            return i
+        return -1
+
+    def __getitem__(self, hash: int):
+        i = self.find(hash)
+        if i == -1:
+            raise KeyError(hash)
+        entry = SqPackIndexHashTable(
+            hash.to_bytes(8, byteorder='little') + self.data[i].to_bytes(4, byteorder='little') + bytes(4)
+        )
+        return [entry, self.sqpacks[self.sqpack_ids[i]]]
+
+    def __contains__(self, hash: object) -> bool:
+        return isinstance(hash, int) and self.find(hash) != -1
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.hashes)
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+
+class SharedIndex:
+    """Repository indexes built once into a shared memory segment that other processes attach to
+
+    Layout: magic, format version, metadata size, JSON metadata, then per repository the sorted
+    uint64 hashes, uint32 index data and uint16 sqpack ids, followed by the raw bytes of preloaded files
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+        self.name = shm.name
+        metadata_size = int.from_bytes(shm.buf[8:16], byteorder='little')
+        self.metadata = json.loads(bytes(shm.buf[HEADER_SIZE : HEADER_SIZE + metadata_size]))
+        self.root: str = self.metadata['root']
+        self.views: list[memoryview] = []
+        self.sqpacks: list[SqPack] = []
+
+    @classmethod
+    def create(cls, game_data: GameData, name: str = None, include_excel: bool = False) -> 'SharedIndex':
+        """Packs the indexes of an already set up GameData, include_excel also stores root.exl and every .exh"""
+        repositories = []
+        arrays: list[tuple[array.array, array.array, array.array]] = []
+        files: list[bytes] = []
+        for repo_index, repo in game_data.repositories.items():
+            sqpack_ids = {id(sqpack): i for i, sqpack in enumerate(repo.sqpacks)}
+            hashes = array.array('Q', sorted(repo.index.keys()))
+            data = array.array('I', (repo.index[hash][0].data for hash in hashes))
+            sqpacks = array.array('H', (sqpack_ids[id(repo.index[hash][1])] for hash in hashes))
+            arrays.append((hashes, data, sqpacks))
+            repositories.append(
+                {
+                    'index': repo_index,
+                    'name': repo.name,
+                    'version': [
+                        repo.version.year,
+                        repo.version.month,
+                        repo.version.date,
+                        repo.version.patch,
+                        repo.version.build,
+                    ],
+                    'sqpacks': [{'path': sqpack.path, 'data_files': sqpack.data_files} for sqpack in repo.sqpacks],
+                    'count': len(hashes),
+                    'preloaded': [],
+                }
+            )
+
+        if include_excel:
+            exl = ParsedFileName('exd/root.exl')
+            exl_data = b''.join(game_data.get_file(exl))
+            preload = [(exl, exl_data)]
+            for sheet in ExcelListFile([exl_data]).dict.values():
+                exh = ParsedFileName(f'exd/{sheet}.exh')
+                preload.append((exh, b''.join(game_data.get_file(exh))))
+            for file, data in preload:
+                for repo in repositories:
+                    if repo['name'] == file.repo:
+                        repo['preloaded'].append([file.index, len(files)])
+                files.append(data)
+
+        # offsets depend on the metadata size, so lay out the arrays relative to the end of it first
+        offset = 0
+        for repo, (hashes, data, sqpacks) in zip(repositories, arrays):
+            repo['hashes'] = offset
+            offset = align(offset + len(hashes) * 8)
+            repo['data'] = offset
+            offset = align(offset + len(data) * 4)
+            repo['sqpack_ids'] = offset
+            offset = align(offset + len(sqpacks) * 2)
+        file_offsets = []
+        for data in files:
+            file_offsets.append([offset, len(data)])
+            offset = align(offset + len(data))
+
+        metadata = {'root': game_data.root, 'repositories': repositories, 'files': file_offsets}
+        # leave room for every offset to grow by the digits of the base offset
+        base = align(HEADER_SIZE + len(json.dumps(metadata)) + 16 * (len(repositories) * 3 + len(files)) + 64)
+        for repo in repositories:
+            repo['hashes'] += base
+            repo['data'] += base
+            repo['sqpack_ids'] += base
+        for file_offset in file_offsets:
+            file_offset[0] += base
+        metadata_bytes = json.dumps(metadata).encode('utf-8')
+        if HEADER_SIZE + len(metadata_bytes) > base:
+            raise Exception('Shared index metadata does not fit in its reserved space')
+
+        shm = shared_memory.SharedMemory(name=name, create=True, size=max(base + offset, 1))
+        shm.buf[0:4] = MAGIC
+        shm.buf[4:8] = (1).to_bytes(4, byteorder='little')
+        shm.buf[8:16] = len(metadata_bytes).to_bytes(8, byteorder='little')
+        shm.buf[HEADER_SIZE : HEADER_SIZE + len(metadata_bytes)] = metadata_bytes
+        for repo, (hashes, data, sqpacks) in zip(repositories, arrays):
+            for start, values in [(repo['hashes'], hashes), (repo['data'], data), (repo['sqpack_ids'], sqpacks)]:
+                raw = values.tobytes()
+                shm.buf[start : start + len(raw)] = raw
+        for (start, size), data in zip(file_offsets, files):
+            shm.buf[start : start + size] = data
+        return cls(shm, True)
+
+    @classmethod
+    def attach(cls, name: str) -> 'SharedIndex':
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            shm = shared_memory.SharedMemory(name=name)
+            if os.name == 'posix':
+                # before 3.13 every attaching process registers the segment and unlinks it on exit
+                resource_tracker.unregister(shm._name, 'shared_memory')
+        if bytes(shm.buf[0:4]) != MAGIC:
+            shm.close()
+            raise Exception(f'{name} is not a shared index')
+        return cls(shm, False)
+
+    def get_view(self, offset: int, count: int, format: str, size: int) -> memoryview:
+        view = self.shm.buf[offset : offset + count * size].cast(format)
+        self.views.append(view)
+        return view
+
+    def get_repositories(self) -> dict[int, Repository]:
+        repositories: dict[int, Repository] = {}
+        for meta in self.metadata['repositories']:
+            repo = Repository(meta['name'], self.root)
+            repo.version = SemanticVersion(*meta['version'])
+            for sqpack_meta in meta['sqpacks']:
+                sqpack = SqPack(self.root, sqpack_meta['path'])
+                sqpack.data_files = sqpack_meta['data_files']
+                repo.sqpacks.append(sqpack)
+                self.sqpacks.append(sqpack)
+            repo.index = SharedRepositoryIndex(
+                self.get_view(meta['hashes'], meta['count'], 'Q', 8),
+                self.get_view(meta['data'], meta['count'], 'I', 4),
+                self.get_view(meta['sqpack_ids'], meta['count'], 'H', 2),
+                repo.sqpacks,
+            )
+            for hash, file in meta['preloaded']:
+                start, size = self.metadata['files'][file]
+                repo.preloaded[hash] = self.get_view(start, size, 'B', 1)
+            repositories[meta['index']] = repo
+        return repositories
+
+    def get_game_data(self, load_schema: bool = False) -> GameData:
+        """GameData reading through this index, its sqpacks have no index header or hash table loaded"""
+        return GameData(self.root, load_schema, shared_index=self)
+
+    def close(self):
+        """Releases this process' mapping, views handed out by get_repositories become invalid"""
+        for view in self.views:
+            view.release()
+        self.views = []
+        for sqpack in self.sqpacks:
+            sqpack.file.close()
+        self.sqpacks = []
+        self.shm.close()
+
+    def unlink(self):
+        if not self.owner:
+            raise Exception('Only the process that created the shared index can unlink it')
+        if os.name == 'posix':
+            # attached processes may have unregistered the segment from a shared resource tracker
+            resource_tracker.register(self.shm._name, 'shared_memory')
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        if self.owner:
+            self.unlink()
+
+    def __repr__(self):
+        return f'''SharedIndex: {self.name} ({self.shm.size} bytes, {sum(x['count'] for x in self.metadata['repositories'])} entries)'''
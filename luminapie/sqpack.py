@@ -1,4 +1,4 @@
-from luminapie.enums import SqPackFileType, SqPackPlatformId
+from luminapie.enums import SqPackFileType, SqPackPlatformId, DatBlockType
 from io import BufferedReader
 import os
 import zlib
@@ -25,6 +25,51 @@ class DatStdFileBlockInfos:
         self.uncompressed_size = int.from_bytes(bytes[6:8], byteorder='little')
 
 
+class DatTextureLodBlock:
+    def __init__(self, bytes: bytes):
+        self.compressed_offset = int.from_bytes(bytes[0:4], byteorder='little')
+        self.compressed_size = int.from_bytes(bytes[4:8], byteorder='little')
+        self.decompressed_size = int.from_bytes(bytes[8:12], byteorder='little')
+        self.block_offset = int.from_bytes(bytes[12:16], byteorder='little')
+        self.block_count = int.from_bytes(bytes[16:20], byteorder='little')
+
+    def __repr__(self):
+        return f'''CompressedOffset: {self.compressed_offset} CompressedSize: {self.compressed_size} DecompressedSize: {self.decompressed_size} BlockOffset: {self.block_offset} BlockCount: {self.block_count}'''
+
+
+class DatModelBlock:
+    # sections in the order of every per section array: stack, runtime, then vertex, edge and index data of 3 lods
+    STACK = 0
+    RUNTIME = 1
+    VERTEX = 2
+    EDGE = 5
+    INDEX = 8
+    SECTION_COUNT = 11
+
+    def __init__(self, bytes: bytes):
+        self.size = int.from_bytes(bytes[0:4], byteorder='little')
+        self.type = SqPackFileType(int.from_bytes(bytes[4:8], byteorder='little'))
+        self.raw_file_size = int.from_bytes(bytes[8:12], byteorder='little')
+        self.number_of_blocks = int.from_bytes(bytes[12:16], byteorder='little')
+        self.used_number_of_blocks = int.from_bytes(bytes[16:20], byteorder='little')
+        self.version = int.from_bytes(bytes[20:24], byteorder='little')
+        self.uncompressed_sizes = [
+            int.from_bytes(bytes[24 + i * 4 : 28 + i * 4], byteorder='little') for i in range(11)
+        ]
+        self.compressed_sizes = [int.from_bytes(bytes[68 + i * 4 : 72 + i * 4], byteorder='little') for i in range(11)]
+        self.offsets = [int.from_bytes(bytes[112 + i * 4 : 116 + i * 4], byteorder='little') for i in range(11)]
+        self.block_index = [int.from_bytes(bytes[156 + i * 2 : 158 + i * 2], byteorder='little') for i in range(11)]
+        self.block_num = [int.from_bytes(bytes[178 + i * 2 : 180 + i * 2], byteorder='little') for i in range(11)]
+        self.vertex_declaration_num = int.from_bytes(bytes[200:202], byteorder='little')
+        self.material_num = int.from_bytes(bytes[202:204], byteorder='little')
+        self.num_lods = bytes[204]
+        self.index_buffer_streaming_enabled = bytes[205]
+        self.edge_geometry_enabled = bytes[206]
+
+    def __repr__(self):
+        return f'''Size: {self.size} Version: {self.version} Blocks: {self.number_of_blocks} Lods: {self.num_lods} Offsets: {self.offsets} BlockIndex: {self.block_index} BlockNum: {self.block_num}'''
+
+
 class DatBlockHeader:
     def __init__(self, bytes: bytes):
         self.size = int.from_bytes(bytes[0:4], byteorder='little')
@@ -32,6 +77,10 @@ class DatBlockHeader:
         self.block_data_size = int.from_bytes(bytes[8:12], byteorder='little')
         self.dat_block_type = int.from_bytes(bytes[12:16], byteorder='little')
 
+    def is_compressed(self):
+        # block_data_size holds the compressed size, or 32000 for stored blocks of dat_block_type bytes
+        return self.block_data_size != DatBlockType.Uncompressed
+
     def __repr__(self):
         return f'''Size: {self.size} Unknown1: {self.unknown1} DatBlockType: {self.dat_block_type} BlockDataSize: {self.block_data_size}'''
 
@@ -122,11 +171,11 @@ class SqPack:
         self.load_index_header()
         self.load_hash_table()
         self.data_files: list[str] = []
-        for file in get_sqpack_files(self.root, self.path.rsplit('\\', 1)[0].split('\\')[-1]):
-            for i in range(0, self.index_header.number_of_data_file):
-                name = self.path.rsplit('.', 1)[0] + '.dat' + str(i)
-                if file == name:
-                    self.data_files.append(file)
+        files = set(get_sqpack_files(self.root, os.path.basename(os.path.dirname(self.path))))
+        for i in range(0, self.index_header.number_of_data_file):
+            name = self.path.rsplit('.', 1)[0] + '.dat' + str(i)
+            if name in files:
+                self.data_files.append(name)
 
     def read_file(self, offset: int):
         if self.path.rsplit('.', 1)[1][0:3] != 'dat':
@@ -139,23 +188,168 @@ class SqPack:
             raise Exception(f'File located at 0x{hex(offset)} is empty.')
         elif file_info.type == SqPackFileType.Standard:
             data = self.read_standard_file(file_info)
+        elif file_info.type == SqPackFileType.Texture:
+            data = self.read_texture_file(file_info)
+        elif file_info.type == SqPackFileType.Model:
+            data = self.read_model_file(file_info)
         else:
             raise Exception('Type: ' + str(file_info.type) + ' not implemented.')
         return data
 
+    def read_file_header(self, offset: int):
+        self.file.seek(offset)
+        file_info = SqPackFileInfo(self.file.read(24), offset)
+        self.file.seek(offset)
+        return file_info, self.file.read(file_info.header_size)
+
+    def read_block(self, offset: int):
+        self.file.seek(offset)
+        block_header = DatBlockHeader(self.file.read(16))
+        if not block_header.is_compressed():
+            return block_header, self.file.read(block_header.dat_block_type)
+        return block_header, zlib.decompress(self.file.read(block_header.block_data_size), wbits=-15)
+
+    def read_raw_block(self, offset: int):
+        """Block header and block data as stored, without inflating"""
+        self.file.seek(offset)
+        header_bytes = self.file.read(16)
+        block_header = DatBlockHeader(header_bytes)
+        size = block_header.block_data_size if block_header.is_compressed() else block_header.dat_block_type
+        return header_bytes + self.file.read(size)
+
     def read_standard_file(self, file_info: SqPackFileInfo):
-        block_bytes = self.file.read(file_info.number_of_blocks * 8)
-        data: list[bytes] = []
-        for i in range(file_info.number_of_blocks):
-            block = DatStdFileBlockInfos(block_bytes[i * 8 : i * 8 + 8])
-            self.file.seek(file_info.offset + file_info.header_size + block.offset)
-            block_header = DatBlockHeader(self.file.read(16))
-            if block_header.dat_block_type == 32000:
-                data.append(self.file.read(block_header.block_data_size))
-            else:
-                data.append(zlib.decompress(self.file.read(block_header.block_data_size), wbits=-15))
+        return [self.read_block(offset)[1] for offset in self.get_block_offsets(file_info)]
+
+    def read_texture_layout(self, file_info: SqPackFileInfo):
+        self.file.seek(file_info.offset + 24)
+        lod_bytes = self.file.read(file_info.number_of_blocks * 20)
+        lods = [DatTextureLodBlock(lod_bytes[i * 20 : i * 20 + 20]) for i in range(file_info.number_of_blocks)]
+        block_count = max((lod.block_offset + lod.block_count for lod in lods), default=0)
+        size_bytes = self.file.read(block_count * 2)
+        block_sizes = [int.from_bytes(size_bytes[i * 2 : i * 2 + 2], byteorder='little') for i in range(block_count)]
+        return lods, block_sizes
 
+    def read_model_layout(self, file_info: SqPackFileInfo):
+        self.file.seek(file_info.offset)
+        model_block = DatModelBlock(self.file.read(208))
+        size_bytes = self.file.read(model_block.number_of_blocks * 2)
+        block_sizes = [
+            int.from_bytes(size_bytes[i * 2 : i * 2 + 2], byteorder='little')
+            for i in range(model_block.number_of_blocks)
+        ]
+        return model_block, block_sizes
+
+    def get_section_block_offsets(
+        self, file_info: SqPackFileInfo, offset: int, first: int, count: int, sizes: list[int]
+    ):
+        offsets: list[int] = []
+        offset += file_info.offset + file_info.header_size
+        for i in range(first, first + count):
+            offsets.append(offset)
+            offset += sizes[i]
+        return offsets
+
+    def get_block_offsets(self, file_info: SqPackFileInfo):
+        """File offsets of every data block of the file, in the order they make up the file"""
+        if file_info.type == SqPackFileType.Standard:
+            self.file.seek(file_info.offset + 24)
+            block_bytes = self.file.read(file_info.number_of_blocks * 8)
+            return [
+                file_info.offset + file_info.header_size + DatStdFileBlockInfos(block_bytes[i * 8 : i * 8 + 8]).offset
+                for i in range(file_info.number_of_blocks)
+            ]
+        elif file_info.type == SqPackFileType.Texture:
+            lods, block_sizes = self.read_texture_layout(file_info)
+            offsets: list[int] = []
+            for lod in lods:
+                offsets.extend(
+                    self.get_section_block_offsets(
+                        file_info, lod.compressed_offset, lod.block_offset, lod.block_count, block_sizes
+                    )
+                )
+            return offsets
+        elif file_info.type == SqPackFileType.Model:
+            model_block, block_sizes = self.read_model_layout(file_info)
+            offsets: list[int] = []
+            for i in range(DatModelBlock.SECTION_COUNT):
+                offsets.extend(
+                    self.get_section_block_offsets(
+                        file_info,
+                        model_block.offsets[i],
+                        model_block.block_index[i],
+                        model_block.block_num[i],
+                        block_sizes,
+                    )
+                )
+            return offsets
+        return []
+
+    def read_texture_prefix(self, file_info: SqPackFileInfo):
+        """The uncompressed texture header stored in front of the first mipmap"""
+        lods, _ = self.read_texture_layout(file_info)
+        if len(lods) == 0 or lods[0].compressed_offset == 0:
+            return b''
+        self.file.seek(file_info.offset + file_info.header_size)
+        return self.file.read(lods[0].compressed_offset)
+
+    def read_texture_file(self, file_info: SqPackFileInfo):
+        data: list[bytes] = [self.read_texture_prefix(file_info)]
+        data.extend(self.read_block(offset)[1] for offset in self.get_block_offsets(file_info))
+        return data
+
+    def read_model_section(self, file_info: SqPackFileInfo, model_block: DatModelBlock, section: int, sizes: list[int]):
+        offsets = self.get_section_block_offsets(
+            file_info,
+            model_block.offsets[section],
+            model_block.block_index[section],
+            model_block.block_num[section],
+            sizes,
+        )
+        data = b''.join(self.read_block(offset)[1] for offset in offsets)
+        if len(data) != model_block.uncompressed_sizes[section]:
+            raise Exception(
+                f'Model section {section} inflated to {len(data)} bytes, expected {model_block.uncompressed_sizes[section]}'
+            )
         return data
 
+    def read_model_file(self, file_info: SqPackFileInfo):
+        # sqpack stores the model sections separately, the .mdl file starts with a 0x44 byte header locating them
+        model_block, block_sizes = self.read_model_layout(file_info)
+        stack = self.read_model_section(file_info, model_block, DatModelBlock.STACK, block_sizes)
+        runtime = self.read_model_section(file_info, model_block, DatModelBlock.RUNTIME, block_sizes)
+        data: list[bytes] = [stack, runtime]
+        position = 0x44 + len(stack) + len(runtime)
+        vertex_offsets = [0, 0, 0]
+        vertex_sizes = [0, 0, 0]
+        index_offsets = [0, 0, 0]
+        index_sizes = [0, 0, 0]
+        for lod in range(3):
+            vertex = self.read_model_section(file_info, model_block, DatModelBlock.VERTEX + lod, block_sizes)
+            edge = self.read_model_section(file_info, model_block, DatModelBlock.EDGE + lod, block_sizes)
+            index = self.read_model_section(file_info, model_block, DatModelBlock.INDEX + lod, block_sizes)
+            # same as Lumina, a lod without blocks or starting where the previous one did has offset 0
+            if model_block.block_num[DatModelBlock.VERTEX + lod] != 0:
+                if lod == 0 or position != vertex_offsets[lod - 1]:
+                    vertex_offsets[lod] = position
+                vertex_sizes[lod] = len(vertex)
+            position += len(vertex) + len(edge)
+            if model_block.block_num[DatModelBlock.INDEX + lod] != 0:
+                if lod == 0 or position != index_offsets[lod - 1]:
+                    index_offsets[lod] = position
+                index_sizes[lod] = len(index)
+            position += len(index)
+            data.extend([vertex, edge, index])
+        header = model_block.version.to_bytes(4, byteorder='little')
+        header += len(stack).to_bytes(4, byteorder='little')
+        header += len(runtime).to_bytes(4, byteorder='little')
+        header += model_block.vertex_declaration_num.to_bytes(2, byteorder='little')
+        header += model_block.material_num.to_bytes(2, byteorder='little')
+        for values in [vertex_offsets, index_offsets, vertex_sizes, index_sizes]:
+            header += b''.join(value.to_bytes(4, byteorder='little') for value in values)
+        header += bytes(
+            [model_block.num_lods, model_block.index_buffer_streaming_enabled, model_block.edge_geometry_enabled, 0]
+        )
+        return [header] + data
+
     def __repr__(self):
         return f'''Path: {os.path.join(self.root, 'sqpack', self.path)} Header: {self.header}'''
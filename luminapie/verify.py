@@ -0,0 +1,288 @@
+from luminapie.sqpack import (
+    SqPack,
+    SqPackIndexHeader,
+    SqPackFileInfo,
+    DatStdFileBlockInfos,
+    DatBlockHeader,
+    DatModelBlock,
+)
+from luminapie.enums import SqPackFileType
+from luminapie.game_data import GameData
+from multiprocessing import Pool
+from io import BufferedReader
+import hashlib
+import time
+import zlib
+
+CHUNK_SIZE = 1 << 20
+TASK_ENTRIES = 4096
+
+# (file path, offset, message)
+VerifyError = tuple[str, int, str]
+
+
+class VerifyResult:
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = 0
+        self.skipped = 0
+        self.bytes = 0
+        self.errors: list[VerifyError] = []
+
+    def error(self, offset: int, message: str):
+        self.errors.append((self.path, offset, message))
+
+
+def sha1_matches(file: BufferedReader, offset: int, size: int, expected: bytes) -> bool:
+    # unused segments are empty, anything with data has to match its stored hash
+    if size == 0:
+        return True
+    sha1 = hashlib.sha1()
+    file.seek(offset)
+    while size > 0:
+        chunk = file.read(min(size, CHUNK_SIZE))
+        if not chunk:
+            return False
+        sha1.update(chunk)
+        size -= len(chunk)
+    return sha1.digest() == expected[0:20]
+
+
+def verify_index_file(path: str) -> VerifyResult:
+    result = VerifyResult(path)
+    with open(path, 'rb') as file:
+        header = file.read(1024)
+        if header[0:8] != b'SqPack\0\0':
+            result.error(0, 'Invalid SqPack header')
+            return result
+        if not sha1_matches(file, 0, 0x3C0, header[0x3C0:0x3D4]):
+            result.error(0, 'SqPack header hash mismatch')
+        header_size = int.from_bytes(header[12:16], byteorder='little')
+        file.seek(header_size)
+        index_header = SqPackIndexHeader(file.read(1024))
+        if not sha1_matches(file, header_size, 960, index_header.hash):
+            result.error(header_size, 'Index header hash mismatch')
+        for name, offset, size, expected in [
+            ('Index data', index_header.index_data_offset, index_header.index_data_size, index_header.index_data_hash),
+            (
+                'Synonym data',
+                index_header.synonym_data_offset,
+                index_header.synonym_data_size,
+                index_header.synonym_data_hash,
+            ),
+            (
+                'Empty block data',
+                index_header.empty_block_data_offset,
+                index_header.empty_block_data_size,
+                index_header.empty_block_data_hash,
+            ),
+            (
+                'Dir index data',
+                index_header.dir_index_data_offset,
+                index_header.dir_index_data_size,
+                index_header.dir_index_data_hash,
+            ),
+        ]:
+            result.entries += 1
+            result.bytes += size
+            if not sha1_matches(file, offset, size, expected):
+                result.error(offset, f'{name} hash mismatch')
+    return result
+
+
+def verify_block(file: BufferedReader, offset: int, expected_size: int, result: VerifyResult):
+    file.seek(offset)
+    header_bytes = file.read(16)
+    if len(header_bytes) != 16:
+        raise Exception(f'Block header at 0x{offset:x} is truncated')
+    block_header = DatBlockHeader(header_bytes)
+    if block_header.size != 16:
+        raise Exception(f'Block header at 0x{offset:x} has invalid size {block_header.size}')
+    if expected_size is not None and block_header.dat_block_type != expected_size:
+        raise Exception(f'Block at 0x{offset:x} declares {block_header.dat_block_type} bytes, expected {expected_size}')
+    if not block_header.is_compressed():
+        size = len(file.read(block_header.dat_block_type))
+        result.bytes += size
+    else:
+        compressed = file.read(block_header.block_data_size)
+        result.bytes += len(compressed)
+        try:
+            size = len(zlib.decompress(compressed, wbits=-15))
+        except zlib.error as e:
+            raise Exception(f'Block at 0x{offset:x} failed to inflate: {e}')
+    if size != block_header.dat_block_type:
+        raise Exception(f'Block at 0x{offset:x} inflated to {size} bytes, expected {block_header.dat_block_type}')
+    return size
+
+
+def verify_standard_file(file: BufferedReader, file_info: SqPackFileInfo, result: VerifyResult):
+    block_bytes = file.read(file_info.number_of_blocks * 8)
+    for i in range(file_info.number_of_blocks):
+        block = DatStdFileBlockInfos(block_bytes[i * 8 : i * 8 + 8])
+        verify_block(file, file_info.offset + file_info.header_size + block.offset, block.uncompressed_size, result)
+
+
+def verify_section(
+    sqpack: SqPack,
+    file_info: SqPackFileInfo,
+    offset: int,
+    first: int,
+    count: int,
+    sizes: list[int],
+    result: VerifyResult,
+):
+    size = 0
+    for block_offset in sqpack.get_section_block_offsets(file_info, offset, first, count, sizes):
+        size += verify_block(sqpack.file, block_offset, None, result)
+    return size
+
+
+def verify_texture_file(sqpack: SqPack, file_info: SqPackFileInfo, result: VerifyResult):
+    lods, block_sizes = sqpack.read_texture_layout(file_info)
+    for i, lod in enumerate(lods):
+        size = verify_section(
+            sqpack, file_info, lod.compressed_offset, lod.block_offset, lod.block_count, block_sizes, result
+        )
+        if size != lod.decompressed_size:
+            raise Exception(f'Mipmap {i} inflated to {size} bytes, expected {lod.decompressed_size}')
+
+
+def verify_model_file(sqpack: SqPack, file_info: SqPackFileInfo, result: VerifyResult):
+    model_block, block_sizes = sqpack.read_model_layout(file_info)
+    for i in range(DatModelBlock.SECTION_COUNT):
+        size = verify_section(
+            sqpack,
+            file_info,
+            model_block.offsets[i],
+            model_block.block_index[i],
+            model_block.block_num[i],
+            block_sizes,
+            result,
+        )
+        if size != model_block.uncompressed_sizes[i]:
+            raise Exception(f'Model section {i} inflated to {size} bytes, expected {model_block.uncompressed_sizes[i]}')
+
+
+def verify_data_file(task: tuple[str, list[int]]) -> VerifyResult:
+    path, offsets = task
+    result = VerifyResult(path)
+    try:
+        sqpack = SqPack(None, path)
+    except Exception as e:
+        result.error(0, f'Invalid SqPack header: {e}')
+        return result
+    if sqpack.header.magic != b'SqPack\0\0':
+        sqpack.file.close()
+        result.error(0, 'Invalid SqPack header')
+        return result
+    try:
+        for offset in offsets:
+            result.entries += 1
+            try:
+                sqpack.file.seek(offset)
+                file_info = SqPackFileInfo(sqpack.file.read(24), offset)
+                if file_info.type == SqPackFileType.Standard:
+                    verify_standard_file(sqpack.file, file_info, result)
+                elif file_info.type == SqPackFileType.Texture:
+                    verify_texture_file(sqpack, file_info, result)
+                elif file_info.type == SqPackFileType.Model:
+                    verify_model_file(sqpack, file_info, result)
+                elif file_info.type != SqPackFileType.Empty:
+                    # empty entries hold no data, so there is nothing more to check
+                    result.skipped += 1
+            except Exception as e:
+                result.error(offset, str(e))
+    finally:
+        sqpack.file.close()
+    return result
+
+
+class VerifyReport:
+    def __init__(self):
+        self.index_files = 0
+        self.data_files: set[str] = set()
+        self.entries = 0
+        self.skipped = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.errors: list[VerifyError] = []
+
+    def add(self, result: VerifyResult):
+        self.entries += result.entries
+        self.skipped += result.skipped
+        self.bytes += result.bytes
+        self.errors.extend(result.errors)
+
+    def ok(self) -> bool:
+        """No errors and no entry left unchecked"""
+        return len(self.errors) == 0 and self.skipped == 0
+
+    def throughput(self) -> float:
+        """MiB read per second"""
+        return self.bytes / (1 << 20) / self.seconds if self.seconds > 0 else 0.0
+
+    def __repr__(self):
+        return f'''VerifyReport: index files: {self.index_files}, data files: {len(self.data_files)}, entries: {self.entries}, skipped: {self.skipped}, {self.bytes / (1 << 20):.1f} MiB in {self.seconds:.1f}s ({self.throughput():.1f} MiB/s), errors: {len(self.errors)}'''
+
+
+def get_verify_tasks(
+    game_data: GameData,
+) -> tuple[list[str], list[tuple[str, list[int]]], list[VerifyResult]]:
+    """Index files, data file tasks and the entries that can't be walked
+
+    Entries pointing into a missing .datN are errors against that file. Synonym entries are resolved through the
+    synonym table, which isn't read, so they are counted as skipped
+    """
+    if game_data.shared_index is not None:
+        raise Exception('Verifying needs the index hash tables, which a GameData from a shared index does not load')
+    index_files: list[str] = []
+    offsets: dict[str, set[int]] = {}
+    unchecked: dict[str, VerifyResult] = {}
+    for repo in game_data.repositories.values():
+        for sqpack in repo.sqpacks:
+            index_files.append(sqpack.path)
+            data_files = set(sqpack.data_files)
+            for entry in sqpack.hash_table:
+                if entry.is_synonym():
+                    result = unchecked.setdefault(sqpack.path, VerifyResult(sqpack.path))
+                    result.entries += 1
+                    result.skipped += 1
+                    continue
+                path = sqpack.path.rsplit('.', 1)[0] + '.dat' + str(entry.data_file_id())
+                if path not in data_files:
+                    result = unchecked.setdefault(path, VerifyResult(path))
+                    result.entries += 1
+                    result.error(entry.data_file_offset(), 'Data file is missing')
+                    continue
+                offsets.setdefault(path, set()).add(entry.data_file_offset())
+    tasks: list[tuple[str, list[int]]] = []
+    for path in offsets:
+        # split large data files so a single .datN doesn't hold up the pool
+        sorted_offsets = sorted(offsets[path])
+        for i in range(0, len(sorted_offsets), TASK_ENTRIES):
+            tasks.append((path, sorted_offsets[i : i + TASK_ENTRIES]))
+    # largest files first so the pool drains evenly
+    tasks.sort(key=lambda task: len(offsets[task[0]]), reverse=True)
+    return index_files, tasks, list(unchecked.values())
+
+
+def verify_game_data(game_data: GameData, processes: int = None) -> VerifyReport:
+    report = VerifyReport()
+    start = time.perf_counter()
+    index_files, tasks, unchecked = get_verify_tasks(game_data)
+    for result in unchecked:
+        report.add(result)
+    with Pool(processes) as pool:
+        for result in pool.imap_unordered(verify_index_file, index_files):
+            report.index_files += 1
+            report.add(result)
+        for result in pool.imap_unordered(verify_data_file, tasks):
+            report.data_files.add(result.path)
+            report.add(result)
+    report.seconds = time.perf_counter() - start
+    report.errors.sort()
+    return report
+
+
+def verify_game_dir(root: str, processes: int = None) -> VerifyReport:
+    return verify_game_data(GameData(root, load_schema=False), processes)